@@ -1,178 +1,331 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import yfinance as yf
-import requests
-from bs4 import BeautifulSoup
+from curl_cffi import requests as cffi_requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from datetime import datetime, date, timedelta
+from io import BytesIO, StringIO
+
+# Shared HTTP session so repeated fetches reuse pooled keep-alive connections.
+# Responses are also persisted to SQLite so restarts don't re-download everything,
+# and a stale copy is served if the upstream errors out (e.g. CoinGecko rate limits).
+# Built once per server process: Streamlit re-executes this script on every rerun,
+# so a module-level session would be rebuilt (and its pool discarded) on each click.
+@st.cache_resource
+def get_http_session():
+    session = CachedSession(
+        'http_cache.sqlite',
+        backend='sqlite',
+        expire_after=60,
+        urls_expire_after={
+            'api.coingecko.com': 60,
+            'bitcointreasuries.net': 3600,
+            'www.strategy.com': 86400
+        },
+        stale_if_error=True
+    )
+    session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; MSTR-Treasury-Dashboard)'})
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        # Bounded retries: at most ~1s of backoff in total. Retry-After is deliberately ignored
+        # (CoinGecko can ask for 60s+), so a rate limit falls through to the stale cached
+        # response (stale_if_error) quickly instead of blocking the page.
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.5,
+            backoff_max=2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=False
+        )
+    ))
+    return session
+
+# (connect, read) timeouts so a stalled upstream fails fast instead of hanging the page
+HTTP_TIMEOUT = (3, 5)
+
+# Shared browser-impersonating session for yfinance so MSTR and STRC reuse one
+# TCP/TLS connection to Yahoo (and avoid its bot-detection 429s). Set up once per
+# process: set_tz_cache_location resets yfinance's shared tz/cookie store, which
+# must not happen under other sessions' in-flight fetches on every rerun.
+@st.cache_resource
+def get_yf_session():
+    yf.set_tz_cache_location('./.yf-cache')
+    return cffi_requests.Session(impersonate="chrome")
+
+# Matches the Strategy (formerly MicroStrategy) row on bitcointreasuries.net
+STRATEGY_PATTERN = re.compile(r'(?:Micro)?Strategy')
+
+# Fetchers come in pairs: the cached fetch_* function raises on any failure (st.cache_data
+# never caches exceptions, so a transient error isn't pinned for the whole TTL), and the
+# uncached get_* wrapper applies the fallback value and returns (value, notices).
 
 # Function to fetch current BTC price from CoinGecko API
-def get_btc_price():
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_btc_price():
     url = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd"
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()['bitcoin']['usd']
+
+def get_btc_price():
     try:
-        response = requests.get(url)
-        data = response.json()
-        return data['bitcoin']['usd']
+        return fetch_btc_price(), []
     except Exception as e:
-        st.error(f"Error fetching BTC price: {e}")
-        return None
+        return None, [('error', f"Error fetching BTC price: {e}")]
 
 # Function to scrape MicroStrategy's BTC holdings from bitcointreasuries.net
-def get_btc_holdings():
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_btc_holdings():
     url = "https://bitcointreasuries.net/"
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    # lxml's parser returns only the tables mentioning Strategy; no per-row soup walk
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        rows = soup.find_all('tr')
-        for row in rows:
-            cells = row.find_all('td')
-            if cells and ('MicroStrategy' in cells[0].text or 'Strategy' in cells[0].text):
-                holdings_str = cells[1].text.strip().replace(',', '')
-                return int(holdings_str)
-        st.warning("Could not find MicroStrategy entry; using fallback value.")
-        return 687410
-    except Exception as e:
-        st.error(f"Error scraping holdings: {e}")
-        return 687410
+        tables = pd.read_html(StringIO(response.text), flavor='lxml', match=STRATEGY_PATTERN)
+    except ValueError:
+        tables = []
+    for table in tables:
+        rows = table[table.iloc[:, 0].astype(str).str.contains(STRATEGY_PATTERN)]
+        if not rows.empty:
+            holdings_str = str(rows.iloc[0, 1]).replace(',', '').strip()
+            return int(float(holdings_str))
+    raise LookupError("Could not find MicroStrategy entry")
 
-# Fetch MSTR and STRC stock data using yfinance
-def get_stock_data(ticker):
-    stock = yf.Ticker(ticker)
+def get_btc_holdings():
     try:
-        info = stock.info
-        hist = stock.history(period="1d")
+        return fetch_btc_holdings(), []
+    except LookupError as e:
+        return 687410, [('warning', f"{e}; using fallback value.")]
+    except Exception as e:
+        return 687410, [('error', f"Error scraping holdings: {e}")]
+
+EMPTY_QUOTE = {'market_cap': 0, 'shares_outstanding': 0, 'last_price': 0, 'daily_volume': 0, 'high': 0, 'low': 0}
+
+# Fetch MSTR and STRC stock data using one batched yfinance download
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_stocks_batch(tickers):
+    yf_session = get_yf_session()
+    hist_all = yf.download(tickers, period="1d", group_by="ticker", threads=True, progress=False, session=yf_session)
+    tk = yf.Tickers(" ".join(tickers), session=yf_session)
+    stocks = {}
+    for ticker in tickers:
+        # Prices come from the batched download; fast_info only supplies the share count.
+        # fast_info.last_price and .info each cost extra requests, so they're only
+        # touched when the batch came back empty or incomplete.
+        stock = tk.tickers[ticker]
+        shares = stock.fast_info.shares
+        hist = hist_all[ticker].dropna(subset=['Close'])
         if not hist.empty:
-            daily_volume = hist['Volume'].iloc[-1]
+            daily_volume = int(hist['Volume'].iloc[-1])
             close_price = hist['Close'].iloc[-1]
             high_price = hist['High'].iloc[-1]
             low_price = hist['Low'].iloc[-1]
         else:
             daily_volume = 0
-            close_price = info.get('regularMarketPrice', 0)
+            close_price = stock.fast_info.last_price
+        if not (shares and close_price):
+            info = stock.info
+            shares = shares or info.get('sharesOutstanding', 0)
+            close_price = close_price or info.get('regularMarketPrice', 0)
+        if hist.empty:
             high_price = close_price
             low_price = close_price
-        return {
-            'market_cap': info.get('marketCap', 0),
-            'shares_outstanding': info.get('sharesOutstanding', 0),
+        stocks[ticker] = {
+            'market_cap': shares * close_price,
+            'shares_outstanding': shares,
             'last_price': close_price,
             'daily_volume': daily_volume,
             'high': high_price,
             'low': low_price
         }
-    except Exception as e:
-        st.error(f"Error fetching {ticker} data: {e}")
-        return {'market_cap': 0, 'shares_outstanding': 0, 'last_price': 0, 'daily_volume': 0, 'high': 0, 'low': 0}
+    return stocks
+
+def get_stocks_batch(tickers):
+    try:
+        return fetch_stocks_batch(tickers), []
+    except Exception:
+        pass
+    # Retry each ticker on its own so one failing symbol doesn't blank the others
+    stocks = {}
+    notices = []
+    for ticker in tickers:
+        try:
+            stocks.update(fetch_stocks_batch([ticker]))
+        except Exception as e:
+            notices.append(('error', f"Error fetching {ticker} data: {e}"))
+            stocks[ticker] = dict(EMPTY_QUOTE)
+    return stocks, notices
 
 # New: Scrape historical purchases from strategy.com/purchases
-def get_historical_purchases():
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_historical_purchases():
     url = "https://www.strategy.com/purchases"
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'lxml', parse_only=SoupStrainer('table'))
+    table = soup.find('table')
+    if not table:
+        raise LookupError("Could not find purchases table")
+    df = pd.read_html(StringIO(str(table)))[0]
+    df['Reported'] = pd.to_datetime(df['Reported'], errors='coerce')
+    df = df.dropna(subset=['Reported']).sort_values('Reported')
+    for col in ['BTC Acq', 'BTC']:
+        df[col] = df[col].str.extract(r'([\d,]+\.?\d*)', expand=False).str.replace(',', '', regex=False).astype(float)
+    df = df.rename(columns={'BTC': 'Cumulative BTC'})  # Use total holdings column
+    return df
+
+def get_historical_purchases():
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table')
-        if table:
-            df = pd.read_html(str(table))[0]
-            df['Reported'] = pd.to_datetime(df['Reported'], errors='coerce')
-            df = df.dropna(subset=['Reported']).sort_values('Reported')
-            df['BTC Acq'] = df['BTC Acq'].str.replace('₿ ', '').str.replace(',', '').astype(float)
-            df['Cumulative BTC'] = df['BTC'].str.replace('₿ ', '').str.replace(',', '').astype(float)  # Use total holdings column
-            return df
-        else:
-            st.warning("Could not find purchases table; using sample data.")
-            # Fallback sample DF based on known history
-            data = {
-                'Reported': ['2020-08-11', '2021-02-24', '2024-03-11', '2025-12-15', '2026-01-12'],
-                'BTC Acq': [21454, 19452, 12000, 10645, 13627],
-                'Cumulative BTC': [21454, 90000, 300000, 671268, 687410]  # Approximate
-            }
-            return pd.DataFrame(data)
+        return fetch_historical_purchases(), []
+    except LookupError as e:
+        # Fallback sample DF based on known history
+        data = {
+            'Reported': ['2020-08-11', '2021-02-24', '2024-03-11', '2025-12-15', '2026-01-12'],
+            'BTC Acq': [21454, 19452, 12000, 10645, 13627],
+            'Cumulative BTC': [21454, 90000, 300000, 671268, 687410]  # Approximate
+        }
+        return pd.DataFrame(data), [('warning', f"{e}; using sample data.")]
     except Exception as e:
-        st.error(f"Error scraping purchases: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), [('error', f"Error scraping purchases: {e}")]
 
 # New: Assign approximate funding sources based on periods (from filings/analysis)
 def assign_funding_sources(df):
     sources = ['Common Stock', 'Convertible Debt', 'STRC', 'STRK', 'STRD', 'STRF', 'STRE']
-    df[sources] = 0.0
-    for idx, row in df.iterrows():
-        year = row['Reported'].year
-        acq = row['BTC Acq']
-        if year <= 2022:
-            # Early: Mostly convertible debt
-            df.at[idx, 'Convertible Debt'] = acq * 0.8
-            df.at[idx, 'Common Stock'] = acq * 0.2
-        elif year == 2023 or year == 2024:
-            # Mid: Common ATM dominant
-            df.at[idx, 'Common Stock'] = acq * 0.7
-            df.at[idx, 'Convertible Debt'] = acq * 0.3
-        else:
-            # Recent/Future: Preferred heavy
-            df.at[idx, 'Common Stock'] = acq * 0.5
-            df.at[idx, 'STRC'] = acq * 0.1
-            df.at[idx, 'STRK'] = acq * 0.1
-            df.at[idx, 'STRD'] = acq * 0.1
-            df.at[idx, 'STRF'] = acq * 0.1
-            df.at[idx, 'STRE'] = acq * 0.1
-    for source in sources:
-        df[f'Cum {source}'] = df[source].cumsum()
+    year = df['Reported'].dt.year.to_numpy()
+    acq = df['BTC Acq'].to_numpy(dtype=float)
+    # Early: Mostly convertible debt; Mid: Common ATM dominant; Recent/Future: Preferred heavy
+    early = year <= 2022
+    mid = (year == 2023) | (year == 2024)
+    late = ~(early | mid)
+    df['Common Stock'] = np.where(early, acq * 0.2, np.where(mid, acq * 0.7, acq * 0.5))
+    df['Convertible Debt'] = np.where(early, acq * 0.8, np.where(mid, acq * 0.3, 0.0))
+    for pref in ['STRC', 'STRK', 'STRD', 'STRF', 'STRE']:
+        df[pref] = np.where(late, acq * 0.1, 0.0)
+    cum_arr = df[sources].to_numpy(dtype=np.float64).cumsum(axis=0)
+    df = pd.concat([df, pd.DataFrame(cum_arr, columns=[f'Cum {source}' for source in sources], index=df.index)], axis=1)
     return df, sources
 
+GENESIS_DATE = date(2009, 1, 3)
+POWER_LAW_FIRST_YEAR = 2009
+POWER_LAW_LAST_YEAR = 2099
+
+# Year-end BTC power-law prices. Cached as a shared resource so the table is built once
+# per process rather than on every rerun; the array is read-only, so sharing is safe.
+@st.cache_resource
+def get_power_law_prices():
+    years = np.arange(POWER_LAW_FIRST_YEAR, POWER_LAW_LAST_YEAR + 1)
+    prices = 10 ** -1.847796462 * (
+        np.array([(date(year, 12, 31) - GENESIS_DATE).days for year in years]) / 365.25
+    ) ** 5.616314045
+    prices.setflags(write=False)
+    return prices
+
 # New: Forecast future acquisitions using BTC power law
-def forecast_acquisitions(last_date, last_cum_btc, sources):
-    genesis = date(2009, 1, 3)
+def forecast_acquisitions(last_date, last_cum_btc, last_cum_sources, sources):
     annual_raise = 10000000000  # $10B/year assumption
-    future_years = range(last_date.year + 1, last_date.year + 11)
-    future_df = pd.DataFrame({'Reported': [datetime(year, 12, 31) for year in future_years]})
-    future_df['BTC Acq'] = 0.0
-    future_df[sources] = 0.0
-    cum_btc = last_cum_btc
-    for idx, row in future_df.iterrows():
-        days = (row['Reported'].date() - genesis).days
-        years = days / 365.25
-        proj_price = 10 ** -1.847796462 * years ** 5.616314045
-        btc_added = annual_raise / proj_price
-        future_df.at[idx, 'BTC Acq'] = btc_added
-        cum_btc += btc_added
-        future_df.at[idx, 'Cumulative BTC'] = cum_btc
-        # Assume future split: 60% preferred (even), 30% common, 10% convertible
-        future_df.at[idx, 'Common Stock'] = btc_added * 0.3
-        future_df.at[idx, 'Convertible Debt'] = btc_added * 0.1
-        for pref in ['STRC', 'STRK', 'STRD', 'STRF', 'STRE']:
-            future_df.at[idx, pref] = btc_added * 0.12
-    for source in sources:
-        future_df[f'Cum {source}'] = future_df[source].cumsum() + df[f'Cum {source}'].iloc[-1]
+    future_years = np.arange(last_date.year + 1, last_date.year + 11)
+    reported = [datetime(int(year), 12, 31) for year in future_years]
+    if future_years[0] < POWER_LAW_FIRST_YEAR or future_years[-1] > POWER_LAW_LAST_YEAR:
+        raise ValueError(
+            f"Forecast years {future_years[0]}-{future_years[-1]} fall outside the power-law table "
+            f"({POWER_LAW_FIRST_YEAR}-{POWER_LAW_LAST_YEAR})"
+        )
+    proj_price = get_power_law_prices()[future_years - POWER_LAW_FIRST_YEAR]
+    btc_added = annual_raise / proj_price
+    # Assume future split: 60% preferred (even), 30% common, 10% convertible
+    future_df = pd.DataFrame({
+        'Reported': reported,
+        'BTC Acq': btc_added,
+        'Cumulative BTC': last_cum_btc + np.cumsum(btc_added),
+        'Common Stock': btc_added * 0.3,
+        'Convertible Debt': btc_added * 0.1,
+        **{pref: btc_added * 0.12 for pref in ['STRC', 'STRK', 'STRD', 'STRF', 'STRE']}
+    })
+    cum_arr = future_df[sources].to_numpy(dtype=np.float64).cumsum(axis=0) + last_cum_sources
+    future_df = pd.concat([future_df, pd.DataFrame(cum_arr, columns=[f'Cum {source}' for source in sources], index=future_df.index)], axis=1)
     return future_df
 
-# Main Streamlit app
-st.title("Strategy Inc. (MSTR) Bitcoin Treasury Analysis Dashboard")
-st.markdown("""
-This dashboard provides real-time insights into Strategy's valuation, Bitcoin treasury, amplification via preferred stocks, estimated daily BTC acquisitions from STRC issuances, and common stock ATM estimates. Now includes historical/forecasted acquisitions chart with source attribution. Data is fetched live where possible.
-""")
+# STRC ATM issuance assumptions
+ATM_THRESHOLD = 100.05
+ATM_PCT = 0.40
+COMMISSION = 0.025
 
-# Fetch data
-btc_holdings = get_btc_holdings()
-btc_price = get_btc_price()
-mstr_data = get_stock_data("MSTR")
-strc_data = get_stock_data("STRC")
+# Estimate volume traded at/above the ATM threshold, assuming volume is spread evenly over the
+# day's high-low range. Branchless, so it accepts scalars or per-day arrays alike.
+def atm_volume_above(high, low, threshold, volume):
+    span = np.maximum(high - low, 1e-9)
+    frac = np.clip((high - threshold) / span, 0.0, 1.0)
+    frac = np.where(low >= threshold, 1.0, frac)
+    frac = np.where(high < threshold, 0.0, frac)
+    return volume * frac
 
-if btc_price and mstr_data['market_cap'] > 0:
+# Derive valuation and issuance estimates from the fetched inputs (pure; no Streamlit calls)
+def compute_metrics(btc_price, btc_holdings, mstr_data, strc_data):
     treasury_value = btc_holdings * btc_price
     btc_per_share = btc_holdings / mstr_data['shares_outstanding'] if mstr_data['shares_outstanding'] > 0 else 0
-    
+
     # Approximate net liabilities
     approx_debt = 8000000000
     approx_preferred_notional = 8000000000
     approx_cash = 2190000000
     net_liabilities = approx_debt + approx_preferred_notional - approx_cash
-    
+
     ev = mstr_data['market_cap'] + net_liabilities
     leverage_amplification = treasury_value / mstr_data['market_cap'] if mstr_data['market_cap'] > 0 else 0
     nav = treasury_value - net_liabilities
     premium_to_nav = mstr_data['market_cap'] / nav if nav > 0 else 0
 
-    # Key Metrics table
-    st.subheader("Key Metrics")
-    data = {
+    # STRC issuances: share of volume traded at/above the ATM threshold
+    volume_above = atm_volume_above(strc_data['high'], strc_data['low'], ATM_THRESHOLD, strc_data['daily_volume'])
+
+    est_shares_issued = volume_above * ATM_PCT
+    gross_proceeds = est_shares_issued * strc_data['last_price']
+    net_proceeds = gross_proceeds * (1 - COMMISSION)
+    est_btc_from_strc = net_proceeds / btc_price if btc_price > 0 else 0
+
+    # MSTR common issuance scales with the premium to NAV
+    if premium_to_nav <= 1.0:
+        issuance_pct = 0.001
+    elif premium_to_nav >= 3.0:
+        issuance_pct = 0.05
+    else:
+        issuance_pct = 0.001 + 0.049 * ((premium_to_nav - 1.0) / 2.0)
+
+    est_new_common_shares = mstr_data['daily_volume'] * issuance_pct
+    est_proceeds_common = est_new_common_shares * mstr_data['last_price']
+    est_btc_from_common = est_proceeds_common / btc_price if btc_price > 0 else 0
+
+    return {
+        'treasury_value': treasury_value,
+        'btc_per_share': btc_per_share,
+        'ev': ev,
+        'leverage_amplification': leverage_amplification,
+        'nav': nav,
+        'premium_to_nav': premium_to_nav,
+        'volume_above': volume_above,
+        'est_shares_issued': est_shares_issued,
+        'net_proceeds': net_proceeds,
+        'est_btc_from_strc': est_btc_from_strc,
+        'issuance_pct': issuance_pct,
+        'est_new_common_shares': est_new_common_shares,
+        'est_proceeds_common': est_proceeds_common,
+        'est_btc_from_common': est_btc_from_common
+    }
+
+# Key Metrics table with display-formatted values; cached so reruns reuse the Arrow payload
+@st.cache_data(ttl=60, max_entries=8)
+def build_metrics_df(btc_holdings, btc_price, market_cap, shares_outstanding, metrics):
+    return pd.DataFrame({
         "Metric": [
             "Bitcoin Hold Amount",
             "Current Bitcoin Price (USD)",
@@ -187,16 +340,110 @@ if btc_price and mstr_data['market_cap'] > 0:
         "Value": [
             f"{btc_holdings:,} BTC",
             f"${btc_price:,.2f}",
-            f"${treasury_value:,.0f}",
-            f"${mstr_data['market_cap']:,.0f}",
-            f"{mstr_data['shares_outstanding']:,}",
-            f"{btc_per_share:.6f} BTC/share",
-            f"${ev:,.0f}",
-            f"{leverage_amplification:.2f}x",
-            f"{premium_to_nav:.2f}x"
+            f"${metrics['treasury_value']:,.0f}",
+            f"${market_cap:,.0f}",
+            f"{shares_outstanding:,}",
+            f"{metrics['btc_per_share']:.6f} BTC/share",
+            f"${metrics['ev']:,.0f}",
+            f"{metrics['leverage_amplification']:.2f}x",
+            f"{metrics['premium_to_nav']:.2f}x"
         ]
-    }
-    st.table(data)
+    })
+
+# Render the stacked acquisitions chart to PNG; cached so reruns with unchanged data reuse the image.
+# A standalone Figure stays out of pyplot's global registry, and returning bytes means sessions
+# never share (and concurrently savefig) a mutable Figure.
+@st.cache_data(max_entries=4)
+def build_chart(dates_tuple, Y_bytes, sources_tuple):
+    Y = np.frombuffer(Y_bytes, dtype=np.float32).reshape(len(sources_tuple), -1)
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.stackplot(np.array(dates_tuple), Y, labels=list(sources_tuple), alpha=0.8)
+    ax.set_title('Cumulative BTC Holdings by Funding Source (Historical + 10-Year Forecast)')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Cumulative BTC')
+    ax.legend(loc='upper left')
+    ax.grid(True)
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=200, bbox_inches='tight')
+    return buf.getvalue()
+
+# Kick off all fetches in the background so they overlap with each other and with page setup.
+# Fetchers return (value, notices) rather than calling st.* so all page output stays on the
+# script thread in a fixed order.
+def start_fetches():
+    # One short-lived executor per run so sessions never queue behind each other
+    pool = ThreadPoolExecutor(max_workers=4)
+    ctx = get_script_run_ctx()
+
+    def call_with_ctx(fn, *args):
+        # Attach the script context so st.cache_data can resolve it from worker threads
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    futures = (
+        pool.submit(call_with_ctx, get_btc_holdings),
+        pool.submit(call_with_ctx, get_btc_price),
+        pool.submit(call_with_ctx, get_stocks_batch, ["MSTR", "STRC"]),
+        pool.submit(call_with_ctx, get_historical_purchases)
+    )
+    # Submitted work still completes; the threads just exit once it's done
+    pool.shutdown(wait=False)
+    return futures
+
+# Render fetcher errors/warnings on the script thread
+def show_notices(notices):
+    for level, message in notices:
+        if level == 'error':
+            st.error(message)
+        else:
+            st.warning(message)
+
+# Manual cache invalidation; fetches are otherwise cached per TTL across reruns,
+# both in-process (st.cache_data) and on disk (the CachedSession's SQLite store)
+if st.sidebar.button("Refresh"):
+    st.cache_data.clear()
+    get_http_session().cache.clear()
+
+# Start fetching before rendering anything else; results are collected below
+f_holdings, f_btc_price, f_stocks, f_purchases = start_fetches()
+
+# Main Streamlit app
+st.title("Strategy Inc. (MSTR) Bitcoin Treasury Analysis Dashboard")
+st.markdown("""
+This dashboard provides real-time insights into Strategy's valuation, Bitcoin treasury, amplification via preferred stocks, estimated daily BTC acquisitions from STRC issuances, and common stock ATM estimates. Now includes historical/forecasted acquisitions chart with source attribution. Data is fetched live where possible.
+""")
+
+# Fetch data
+# The cached fetchers run with show_spinner=False (worker threads must not create page elements),
+# so a single spinner is shown here on the script thread instead
+with st.spinner("Fetching market data..."):
+    btc_holdings, holdings_notices = f_holdings.result()
+    btc_price, price_notices = f_btc_price.result()
+    stocks, stocks_notices = f_stocks.result()
+    df_hist, purchases_notices = f_purchases.result()
+show_notices(holdings_notices + price_notices + stocks_notices + purchases_notices)
+mstr_data = stocks["MSTR"]
+strc_data = stocks["STRC"]
+
+# Fall back to the last good BTC price in this session if CoinGecko keeps failing
+if btc_price:
+    st.session_state['last_btc_price'] = btc_price
+else:
+    btc_price = st.session_state.setdefault('last_btc_price', None)
+
+if btc_price and mstr_data['market_cap'] > 0:
+    # Only recompute derived metrics when the fetched inputs change between reruns
+    metrics_key = (btc_price, btc_holdings, mstr_data, strc_data)
+    if st.session_state.get('metrics_key') != metrics_key:
+        st.session_state['metrics'] = compute_metrics(btc_price, btc_holdings, mstr_data, strc_data)
+        st.session_state['metrics_key'] = metrics_key
+    m = st.session_state['metrics']
+
+    # Key Metrics table
+    st.subheader("Key Metrics")
+    metrics_df = build_metrics_df(btc_holdings, btc_price, mstr_data['market_cap'], mstr_data['shares_outstanding'], m)
+    st.dataframe(metrics_df, hide_index=True, width="stretch")
 
     st.subheader("Amplification Analysis Using Preferred Stocks")
     st.markdown("""
@@ -205,76 +452,47 @@ if btc_price and mstr_data['market_cap'] > 0:
 
     # Estimated Daily BTC from STRC
     st.subheader("Estimated Daily BTC Acquisition from STRC Issuances")
-    atm_threshold = 100.05
-    atm_pct = 0.40
-    commission = 0.025
-    
-    if strc_data['high'] >= atm_threshold:
-        if strc_data['low'] >= atm_threshold:
-            volume_above = strc_data['daily_volume']
-        else:
-            frac_above = (strc_data['high'] - atm_threshold) / (strc_data['high'] - strc_data['low'])
-            volume_above = strc_data['daily_volume'] * max(0, min(1, frac_above))
-    else:
-        volume_above = 0
-    
-    est_shares_issued = volume_above * atm_pct
-    gross_proceeds = est_shares_issued * strc_data['last_price']
-    net_proceeds = gross_proceeds * (1 - commission)
-    est_btc_from_strc = net_proceeds / btc_price if btc_price > 0 else 0
-    
     st.markdown(f"""
-    Using threshold ${atm_threshold:.2f} and {atm_pct*100:.0f}% ATM assumption:  
+    Using threshold ${ATM_THRESHOLD:.2f} and {ATM_PCT*100:.0f}% ATM assumption:  
     - STRC Daily Volume: {strc_data['daily_volume']:,} shares  
-    - Est. Volume ≥ Threshold: {volume_above:,.0f} shares  
-    - Est. New STRC Shares Issued: {est_shares_issued:,.0f}  
-    - Est. Net Proceeds: ${net_proceeds:,.0f}  
-    - Est. BTC Acquired: {est_btc_from_strc:,.2f} BTC  
+    - Est. Volume ≥ Threshold: {m['volume_above']:,.0f} shares  
+    - Est. New STRC Shares Issued: {m['est_shares_issued']:,.0f}  
+    - Est. Net Proceeds: ${m['net_proceeds']:,.0f}  
+    - Est. BTC Acquired: {m['est_btc_from_strc']:,.2f} BTC  
     *Note: Approximation; validate with weekly 8-K filings.*
     """)
 
     # Estimated Daily MSTR Common Issuance
     st.subheader("Estimated Daily MSTR Common Stock Issuance")
-    if premium_to_nav <= 1.0:
-        issuance_pct = 0.001
-    elif premium_to_nav >= 3.0:
-        issuance_pct = 0.05
-    else:
-        issuance_pct = 0.001 + 0.049 * ((premium_to_nav - 1.0) / 2.0)
-    
-    est_new_common_shares = mstr_data['daily_volume'] * issuance_pct
-    est_proceeds_common = est_new_common_shares * mstr_data['last_price']
-    est_btc_from_common = est_proceeds_common / btc_price if btc_price > 0 else 0
-    
     st.markdown(f"""
-    Based on mNAV {premium_to_nav:.2f}x and daily volume {mstr_data['daily_volume']:,} shares:  
-    - Est. Issuance % of Volume: {issuance_pct*100:.2f}%  
-    - Est. New Common Shares: {est_new_common_shares:,.0f}  
-    - Est. Proceeds: ${est_proceeds_common:,.0f}  
-    - Est. BTC Acquired: {est_btc_from_common:,.2f} BTC  
+    Based on mNAV {m['premium_to_nav']:.2f}x and daily volume {mstr_data['daily_volume']:,} shares:  
+    - Est. Issuance % of Volume: {m['issuance_pct']*100:.2f}%  
+    - Est. New Common Shares: {m['est_new_common_shares']:,.0f}  
+    - Est. Proceeds: ${m['est_proceeds_common']:,.0f}  
+    - Est. BTC Acquired: {m['est_btc_from_common']:,.2f} BTC  
     *Note: Model assumes higher issuances at premiums; actual depends on ATM execution.*
     """)
 
     # New: Historical and Forecasted Acquisitions Chart
     st.subheader("Historical and Forecasted Bitcoin Acquisitions")
-    df_hist = get_historical_purchases()
     if not df_hist.empty:
         df_hist, sources = assign_funding_sources(df_hist)
         last_date = df_hist['Reported'].max()
         last_cum_btc = df_hist['Cumulative BTC'].max()
-        df_future = forecast_acquisitions(last_date, last_cum_btc, sources)
-        df_all = pd.concat([df_hist, df_future]).reset_index(drop=True)
+        last_cum_sources = df_hist[[f'Cum {source}' for source in sources]].iloc[-1].to_numpy()
+        df_future = forecast_acquisitions(last_date, last_cum_btc, last_cum_sources, sources)
+
+        # Build the (sources x dates) plot matrix directly instead of concatenating frames
+        n_hist = len(df_hist)
+        dates = np.concatenate([df_hist['Reported'].to_numpy(), df_future['Reported'].to_numpy()])
+        Y = np.empty((len(sources), len(dates)), dtype=np.float32)
+        for i, source in enumerate(sources):
+            Y[i, :n_hist] = df_hist[f'Cum {source}'].to_numpy()
+            Y[i, n_hist:] = df_future[f'Cum {source}'].to_numpy()
 
         # Stacked area chart
-        fig, ax = plt.subplots(figsize=(12, 6))
-        cum_cols = [f'Cum {source}' for source in sources]
-        ax.stackplot(df_all['Reported'], df_all[cum_cols].T, labels=sources, alpha=0.8)
-        ax.set_title('Cumulative BTC Holdings by Funding Source (Historical + 10-Year Forecast)')
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Cumulative BTC')
-        ax.legend(loc='upper left')
-        ax.grid(True)
-        st.pyplot(fig)
+        chart_png = build_chart(tuple(dates), Y.tobytes(), tuple(sources))
+        st.image(chart_png)
 
         st.markdown("""
         *Historical data scraped from strategy.com/purchases. Sources approximated by period (e.g., early convertible-heavy). Forecast assumes $10B annual raises at power law prices, split 60% preferred/30% common/10% convertible. Actuals may vary based on market conditions and Strategy's execution.*